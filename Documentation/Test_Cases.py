@@ -7,8 +7,22 @@ Focus: Metrics generation, scraping, and /metrics endpoint
 import pytest
 import time
 import re
+import os
+import asyncio
 from fastapi.testclient import TestClient
+import main
 from main import app, model_client, guardrails
+from model_client import ModelClient
+from startup import StartupPipeline, load_warmup_prompts
+from prometheus_client import CollectorRegistry, Counter, REGISTRY
+from cardinality import CardinalityGuard, OVERFLOW_LABEL_VALUE
+import io
+import json
+import logging
+from tracing import (
+    Tracer, SpanExporter, TraceContextFilter, tracer, trace_headers,
+    STATUS_ERROR
+)
 
 client = TestClient(app)
 
@@ -332,6 +346,400 @@ class TestBTPCompatibility:
                 "Counter metrics must never decrease"
 
 
+PROMPTS_FILE = os.path.join(os.path.dirname(__file__), "..", "prompts")
+TEST_MODEL_NAME = "startup-test-model"  # keeps the live app's "mistral" series untouched
+
+
+class TestStartupReadiness:
+    """Test Suite 6: Startup Pipeline, Warmup and Readiness Gating"""
+    
+    def test_liveness_endpoint(self):
+        """TC-021: Verify /health/live responds regardless of readiness"""
+        response = client.get("/health/live")
+        assert response.status_code == 200
+        assert response.json()["status"] == "alive"
+    
+    def test_readiness_transition(self, monkeypatch):
+        """TC-022: Verify /health/ready returns 503 before startup and 200 after"""
+        pipeline = StartupPipeline(
+            ModelClient(model_name=TEST_MODEL_NAME),
+            prompts_file=PROMPTS_FILE, warmup_count=1, warmup_timeout=5
+        )
+        monkeypatch.setattr(main, "startup_pipeline", pipeline)
+        
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["phase"] == "pending"
+        
+        asyncio.run(pipeline.run())
+        
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json()["phase"] == "ready"
+    
+    def test_warmup_prompts_skip_header(self):
+        """TC-023: Verify warmup prompts are read without the header line"""
+        prompts = load_warmup_prompts(PROMPTS_FILE, 2)
+        assert len(prompts) == 2
+        assert "Original_Prompt" not in prompts
+        assert load_warmup_prompts(PROMPTS_FILE, 0) == []
+        assert load_warmup_prompts("missing-prompts-file", 3) == []
+    
+    def test_pipeline_becomes_ready_after_warmup(self):
+        """TC-024: Verify pipeline flips ready only after warmup and records phases"""
+        pipeline = StartupPipeline(
+            ModelClient(model_name=TEST_MODEL_NAME),
+            prompts_file=PROMPTS_FILE, warmup_count=2, warmup_timeout=5
+        )
+        assert pipeline.ready is False
+        
+        assert asyncio.run(pipeline.run()) is True
+        assert pipeline.ready and pipeline.phase == "ready"
+        for phase in ["gpu_init", "model_load", "warmup", "total"]:
+            assert phase in pipeline.phase_durations
+        
+        content = client.get("/metrics").text
+        assert 'startup_phase_duration_seconds{phase="warmup"}' in content
+        assert "app_ready" in content
+    
+    def test_warmup_failure_does_not_block_readiness(self):
+        """TC-025: Verify failed warmup prompts are counted but the app still becomes ready"""
+        class FailingClient(ModelClient):
+            async def _call_model(self, prompt):
+                raise RuntimeError("backend unavailable")
+        
+        pipeline = StartupPipeline(
+            FailingClient(model_name=TEST_MODEL_NAME),
+            prompts_file=PROMPTS_FILE, warmup_count=2, warmup_timeout=5
+        )
+        assert asyncio.run(pipeline.run()) is True
+        assert pipeline.phase == "ready"
+        assert pipeline.warmup_failures == 2
+        assert "warmup_prompt_failures_total" in client.get("/metrics").text
+    
+    def test_warmup_timeout_does_not_block_readiness(self):
+        """TC-037: Verify a warmup timeout (slow cold backend) is not fatal"""
+        class SlowClient(ModelClient):
+            async def _call_model(self, prompt):
+                await asyncio.sleep(1)
+        
+        pipeline = StartupPipeline(
+            SlowClient(model_name=TEST_MODEL_NAME),
+            prompts_file=PROMPTS_FILE, warmup_count=1, warmup_timeout=0.01
+        )
+        assert asyncio.run(pipeline.run()) is True
+        assert pipeline.warmup_failures == 1
+    
+    def test_model_load_failure_fails_liveness(self, monkeypatch):
+        """TC-038: Verify a model-load failure makes /health/live return 503"""
+        class BrokenClient(ModelClient):
+            async def load_model(self):
+                raise asyncio.TimeoutError()
+        
+        pipeline = StartupPipeline(
+            BrokenClient(model_name=TEST_MODEL_NAME),
+            prompts_file=PROMPTS_FILE, warmup_count=1, warmup_timeout=5
+        )
+        assert asyncio.run(pipeline.run()) is False
+        assert pipeline.phase == "failed"
+        assert pipeline.error, "Error must be non-empty even for empty exception messages"
+        
+        monkeypatch.setattr(main, "startup_pipeline", pipeline)
+        assert client.get("/health/live").status_code == 503
+        assert client.get("/health/ready").status_code == 503
+
+
+class TestCardinalityGuard:
+    """Test Suite 7: Label Cardinality Guard and Series Budget"""
+    
+    def make_guard(self, **kwargs):
+        return CardinalityGuard(
+            Counter, 'test_guarded_total', 'Guard test counter',
+            ['token_type', 'model_name'],
+            overflow_labels=['model_name'],
+            registry=CollectorRegistry(), **kwargs
+        )
+    
+    def test_overflow_bucket_when_budget_full(self):
+        """TC-026: Verify new label sets beyond the budget go to the overflow series"""
+        guard = self.make_guard(max_series=3)
+        try:
+            for i in range(10):
+                guard.labels(token_type="input", model_name=f"tenant-{i}").inc()
+            
+            assert guard.active_series() == 4, "3 budgeted series + 1 overflow"
+            overflow = guard.registry.get_sample_value(
+                'test_guarded_total',
+                {'token_type': 'input', 'model_name': OVERFLOW_LABEL_VALUE}
+            )
+            assert overflow == 7
+            assert REGISTRY.get_sample_value(
+                'metric_overflow_observations_total',
+                {'metric': 'test_guarded_total'}
+            ) == 7, "Counts every over-budget call, not distinct label sets"
+            
+            # Existing series keep working after the budget is full
+            guard.labels(token_type="input", model_name="tenant-0").inc()
+            assert guard.registry.get_sample_value(
+                'test_guarded_total',
+                {'token_type': 'input', 'model_name': 'tenant-0'}
+            ) == 2
+        finally:
+            guard.unregister()
+    
+    def test_stale_series_expire(self):
+        """TC-027: Verify idle series are removed after the TTL"""
+        guard = self.make_guard(max_series=10, series_ttl=60)
+        try:
+            guard.labels(token_type="input", model_name="idle").inc()
+            assert guard.expire_stale(now=time.time()) == 0
+            assert guard.expire_stale(now=time.time() + 120) == 1
+            assert guard.active_series() == 0
+            assert guard.registry.get_sample_value(
+                'test_guarded_total',
+                {'token_type': 'input', 'model_name': 'idle'}
+            ) is None
+        finally:
+            guard.unregister()
+    
+    def test_status_gauges_never_expire(self):
+        """TC-028: Verify series_ttl=None disables expiry"""
+        guard = self.make_guard(series_ttl=None)
+        try:
+            guard.labels(token_type="input", model_name="mistral").inc()
+            assert guard.expire_stale(now=time.time() + 10 ** 6) == 0
+            assert guard.active_series() == 1
+        finally:
+            guard.unregister()
+    
+    def test_invalid_labels_do_not_use_budget(self):
+        """TC-039: Verify invalid label calls raise ValueError and are not tracked"""
+        guard = self.make_guard(max_series=2, series_ttl=60)
+        try:
+            with pytest.raises(ValueError):
+                guard.labels("only-one")
+            with pytest.raises(ValueError):
+                guard.labels(token_type="input")
+            with pytest.raises(ValueError):
+                guard.labels(token_type="input", model_name="a", extra="b")
+            assert guard.active_series() == 0
+            
+            guard.labels(token_type="input", model_name="valid").inc()
+            assert guard.expire_stale(now=time.time() + 120) == 1
+        finally:
+            guard.unregister()
+    
+    def test_self_metrics_exposed(self):
+        """TC-029: Verify guard self-metrics are on /metrics"""
+        content = client.get("/metrics").text
+        assert 'metric_active_series{metric="tokens_generated_total"}' in content
+        assert "metric_overflow_observations_total" in content
+
+
+class TestRequestTracing:
+    """Test Suite 8: Per-Request Tracing, Sampling and OTLP Export"""
+    
+    def run_trace(self, t, error=False, sleep=0):
+        trace = t.start_trace("POST /v1/generate")
+        with t.span("guardrail_check"):
+            time.sleep(sleep)
+        return t.end_trace(trace, error=error)
+    
+    def test_tail_sampling_keeps_errors_and_slow(self):
+        """TC-030: Verify errored and slow traces are kept when head sampling is off"""
+        t = Tracer(enabled=True, sample_rate=0.0, slow_threshold_ms=50)
+        assert self.run_trace(t) is False, "Fast ok trace should be dropped"
+        assert len(t.spans) == 0
+        assert self.run_trace(t, error=True) is True
+        assert self.run_trace(t, sleep=0.06) is True
+        assert len(t.spans) == 4, "Two kept traces x (root + 1 span)"
+    
+    def test_span_exception_marks_trace_error(self):
+        """TC-031: Verify an exception inside a span forces the trace to be kept"""
+        t = Tracer(enabled=True, sample_rate=0.0)
+        trace = t.start_trace("POST /v1/generate")
+        with pytest.raises(RuntimeError):
+            with t.span("backend_call"):
+                raise RuntimeError("backend down")
+        assert t.end_trace(trace) is True
+        assert all(span.status == STATUS_ERROR for span in t.spans)
+    
+    def test_span_store_is_bounded(self):
+        """TC-032: Verify the span store never exceeds max_spans and only holds whole traces"""
+        def sample():
+            return REGISTRY.get_sample_value(
+                'trace_spans_dropped_total', {'reason': 'store_full'}
+            ) or 0
+        
+        t = Tracer(enabled=True, sample_rate=1.0, max_spans=5)
+        dropped_before = sample()
+        kept = [self.run_trace(t) for _ in range(10)]
+        
+        assert kept == [True, True] + [False] * 8
+        assert len(t.spans) == 4, "Two whole traces of root + 1 span"
+        span_ids = {span.span_id for span in t.spans}
+        assert all(span.parent_id in span_ids for span in t.spans if span.parent_id), \
+            "Every stored child span must have its root in the store"
+        assert sample() - dropped_before == 16
+    
+    def test_disabled_tracer_is_noop(self):
+        """TC-033: Verify disabled tracing records nothing"""
+        t = Tracer(enabled=False)
+        assert t.start_trace("POST /v1/generate") is None
+        with t.span("json_parse") as span:
+            span.set_attribute("ignored", True)
+        assert t.end_trace(None) is False
+        assert trace_headers() == {}
+    
+    def test_export_otlp_json_to_file(self, tmp_path):
+        """TC-034: Verify batches are exported as OTLP/JSON lines"""
+        t = Tracer(enabled=True, sample_rate=1.0)
+        for _ in range(3):
+            self.run_trace(t)
+        
+        out = tmp_path / "spans.jsonl"
+        exporter = SpanExporter(t, file_path=str(out), batch_size=4)
+        assert asyncio.run(exporter.flush()) == 6
+        assert len(t.spans) == 0
+        
+        lines = out.read_text().splitlines()
+        assert len(lines) == 2, "6 spans in batches of 4"
+        body = json.loads(lines[0])
+        spans = body["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert len(spans) == 4
+        assert len(spans[0]["traceId"]) == 32 and len(spans[0]["spanId"]) == 16
+        assert "startTimeUnixNano" in spans[0]
+    
+    def test_export_counts_each_sink_separately(self, tmp_path):
+        """TC-041: Verify a failing endpoint doesn't count spans already written to the file"""
+        def sample(name, labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+        
+        t = Tracer(enabled=True, sample_rate=1.0)
+        self.run_trace(t)
+        
+        out = tmp_path / "spans.jsonl"
+        exporter = SpanExporter(t, file_path=str(out),
+                                endpoint="http://127.0.0.1:9/v1/traces")
+        file_before = sample('trace_spans_exported_total', {'sink': 'file'})
+        dropped_before = sample('trace_spans_dropped_total', {'reason': 'endpoint'})
+        
+        assert asyncio.run(exporter.flush()) == 2
+        assert len(out.read_text().splitlines()) == 1
+        assert sample('trace_spans_exported_total', {'sink': 'file'}) - file_before == 2
+        assert sample('trace_spans_dropped_total', {'reason': 'endpoint'}) - dropped_before == 2
+    
+    def test_stuck_collector_times_out(self):
+        """TC-044: Verify a collector that never answers can't block flush past the timeout"""
+        async def scenario():
+            async def never_answer(reader, writer):
+                await asyncio.sleep(30)
+            
+            server = await asyncio.start_server(never_answer, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            t = Tracer(enabled=True, sample_rate=1.0)
+            self.run_trace(t)
+            exporter = SpanExporter(t, endpoint=f"http://127.0.0.1:{port}/v1/traces",
+                                    timeout=0.2)
+            try:
+                start_time = time.time()
+                exported = await exporter.flush()
+                return exported, time.time() - start_time
+            finally:
+                server.close()
+        
+        exported, elapsed = asyncio.run(scenario())
+        assert exported == 0
+        assert elapsed < 2, "Flush must give up after the export timeout"
+    
+    def test_shutdown_flushes_spans(self, tmp_path, monkeypatch):
+        """TC-042: Verify the shutdown handler exports spans still in the store"""
+        t = Tracer(enabled=True, sample_rate=1.0)
+        self.run_trace(t)
+        
+        out = tmp_path / "spans.jsonl"
+        monkeypatch.setattr(main, "span_exporter", SpanExporter(t, file_path=str(out)))
+        asyncio.run(main.shutdown())
+        
+        assert len(t.spans) == 0
+        assert out.exists() and len(out.read_text().splitlines()) == 1
+    
+    def test_trace_id_propagation(self):
+        """TC-035: Verify traceparent header and log records carry the trace id"""
+        t = Tracer(enabled=True, sample_rate=1.0)
+        trace = t.start_trace("POST /v1/generate")
+        with t.span("backend_call") as span:
+            headers = trace_headers()
+            record = logging.LogRecord("test", logging.INFO, __file__, 0, "msg", None, None)
+            TraceContextFilter().filter(record)
+        t.end_trace(trace)
+        
+        assert headers["traceparent"] == f"00-{trace.trace_id}-{span.span_id}-01"
+        assert record.trace_id == trace.trace_id
+        assert record.span_id == span.span_id
+    
+    def test_json_log_line_carries_trace_id(self):
+        """TC-040: Verify /v1/generate emits a JSON log line with trace_id under the default setup"""
+        logger = logging.getLogger("metric_monitoring")
+        assert logger.getEffectiveLevel() <= logging.INFO, \
+            "INFO records must not be dropped without --log-config"
+        
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logger.handlers[0].formatter)
+        logger.addHandler(handler)
+        try:
+            client.post("/v1/generate", json={"prompt": "log this request"})
+        finally:
+            logger.removeHandler(handler)
+        
+        record = json.loads(stream.getvalue().splitlines()[-1])
+        assert record["msg"] == "generate finished"
+        assert record["status"] == "success"
+        assert re.fullmatch(r"[0-9a-f]{32}", record["trace_id"])
+    
+    def test_generate_records_stage_spans(self):
+        """TC-036: Verify /v1/generate records a span per request stage"""
+        previous_rate, previous_record = tracer.sample_rate, tracer.record_spans
+        tracer.sample_rate = 1.0
+        tracer.record_spans = True
+        tracer.spans.clear()
+        try:
+            client.post("/v1/generate", json={"prompt": "trace this request"})
+            names = {span.name for span in tracer.spans}
+        finally:
+            tracer.sample_rate = previous_rate
+            tracer.record_spans = previous_record
+            tracer.spans.clear()
+        
+        for stage in ["POST /v1/generate", "json_parse", "guardrail_check",
+                      "queue_wait", "backend_call", "nvml_update"]:
+            assert stage in names, f"Missing span: {stage}"
+
+    
+    def test_no_sink_configured_stores_nothing(self):
+        """TC-043: Verify the default config (no export sink) never fills the span store"""
+        assert not main.span_exporter.configured
+        assert tracer.record_spans is False
+        
+        def dropped():
+            return REGISTRY.get_sample_value(
+                'trace_spans_dropped_total', {'reason': 'store_full'}
+            ) or 0
+        
+        previous_threshold = tracer.slow_threshold_ms
+        tracer.slow_threshold_ms = 0  # every request would be tail-sampled
+        dropped_before = dropped()
+        try:
+            for _ in range(5):
+                client.post("/v1/generate", json={"prompt": "no sink configured"})
+        finally:
+            tracer.slow_threshold_ms = previous_threshold
+        
+        assert len(tracer.spans) == 0
+        assert dropped() == dropped_before
+
+
 def run_all_tests():
     """Execute all test cases and return results"""
     pytest.main([__file__, "-v", "--tb=short"])
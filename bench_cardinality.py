@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /metrics scrape time and RSS as the number of series grows.
+
+Simulates a client sending a unique model_name per request and compares
+an unguarded Counter against a CardinalityGuard with a fixed budget.
+
+Usage: python bench_cardinality.py [max_series]
+"""
+
+import gc
+import os
+import sys
+import time
+import resource
+from prometheus_client import CollectorRegistry, Counter, generate_latest
+from cardinality import CardinalityGuard
+
+SERIES_STEPS = [100, 1000, 10000, 50000]
+SCRAPE_ROUNDS = 5
+
+
+def rss_mb():
+    """Current resident set size in MB (falls back to peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def scrape_ms(registry):
+    """Average generate_latest() time in milliseconds"""
+    start_time = time.perf_counter()
+    for _ in range(SCRAPE_ROUNDS):
+        payload = generate_latest(registry)
+    return (time.perf_counter() - start_time) / SCRAPE_ROUNDS * 1000, len(payload)
+
+
+def run(label, make_metric, series):
+    gc.collect()
+    registry = CollectorRegistry()
+    rss_before = rss_mb()
+    metric = make_metric(registry)
+
+    for i in range(series):
+        metric.labels(token_type="input", model_name=f"model-{i}").inc()
+
+    elapsed, size = scrape_ms(registry)
+    rss_delta = rss_mb() - rss_before
+    print(f"{label:<10} {series:>8} {elapsed:>12.2f} {size / 1024:>12.1f} {rss_delta:>10.1f}")
+
+    if isinstance(metric, CardinalityGuard):
+        metric.unregister()
+
+
+def main():
+    max_series = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    def unguarded(registry):
+        return Counter('bench_tokens_total', 'bench', ['token_type', 'model_name'],
+                       registry=registry)
+
+    def guarded(registry):
+        return CardinalityGuard(Counter, 'bench_tokens_total', 'bench',
+                                ['token_type', 'model_name'],
+                                max_series=max_series,
+                                overflow_labels=['model_name'],
+                                registry=registry)
+
+    print(f"{'mode':<10} {'attempted':>8} {'scrape_ms':>12} {'payload_kb':>12} {'rss_mb':>10}")
+    print("-" * 56)
+    for series in SERIES_STEPS:
+        run("unguarded", unguarded, series)
+        run("guarded", guarded, series)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request tracing overhead.
+
+Runs the span pattern used by /v1/generate (root + json_parse,
+guardrail_check, queue_wait, backend_call, nvml_update) and reports the
+cost per request for each tracer mode against an untraced baseline.
+
+Usage: python bench_tracing.py [requests]
+"""
+
+import sys
+import time
+from tracing import Tracer, SPAN_KIND_CLIENT
+
+STAGES = ["json_parse", "guardrail_check", "queue_wait"]
+
+
+def untraced_request():
+    for _ in STAGES:
+        pass
+
+
+def traced_request(tracer):
+    trace = tracer.start_trace("POST /v1/generate")
+    for stage in STAGES:
+        with tracer.span(stage):
+            pass
+    with tracer.span("backend_call", kind=SPAN_KIND_CLIENT) as span:
+        span.set_attribute("model.name", "mistral")
+    with tracer.span("nvml_update"):
+        pass
+    tracer.end_trace(trace)
+    # Keep the store from saturating so every mode measures the same path
+    tracer.spans.clear()
+
+
+def bench(fn, requests):
+    start_time = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start_time) / requests * 1e6
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    modes = [
+        ("disabled", Tracer(enabled=False)),
+        ("no sink (context only)", Tracer(enabled=True, record_spans=False)),
+        ("sample=0 (tail only)", Tracer(enabled=True, sample_rate=0.0)),
+        ("sample=1", Tracer(enabled=True, sample_rate=1.0)),
+    ]
+
+    baseline = bench(untraced_request, requests)
+    print(f"{'mode':<24} {'us/request':>12} {'overhead_us':>12}")
+    print("-" * 50)
+    print(f"{'untraced':<24} {baseline:>12.2f} {0:>12.2f}")
+    for name, tracer in modes:
+        cost = bench(lambda: traced_request(tracer), requests)
+        print(f"{name:<24} {cost:>12.2f} {cost - baseline:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
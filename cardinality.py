@@ -0,0 +1,136 @@
+# cardinality.py
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+from prometheus_client import Counter, Gauge, REGISTRY
+
+OVERFLOW_LABEL_VALUE = "overflow"
+DEFAULT_MAX_SERIES = int(os.getenv("METRIC_MAX_SERIES", "500"))
+DEFAULT_SERIES_TTL = float(os.getenv("METRIC_SERIES_TTL_SECONDS", "3600"))
+
+# Self-metrics for the guard itself (never guarded - labels are metric names)
+METRIC_ACTIVE_SERIES = Gauge(
+    'metric_active_series',
+    'Label sets currently exported per guarded metric',
+    ['metric']
+)
+
+METRIC_OVERFLOW_OBSERVATIONS = Counter(
+    'metric_overflow_observations_total',
+    'labels() calls routed to the overflow series because the series budget was full',
+    ['metric']
+)
+
+# All guards created in this process, used for periodic stale-series expiry
+_GUARDS: List["CardinalityGuard"] = []
+
+
+class CardinalityGuard:
+    """
+    Wraps a Prometheus metric and enforces a per-metric series budget.
+
+    - At most `max_series` distinct label sets are created.
+    - Once the budget is full, new label sets are folded into an overflow
+      series where `overflow_labels` are replaced with "overflow".
+    - Series not touched for `series_ttl` seconds are removed by
+      expire_stale(); pass series_ttl=None for status gauges that are
+      set once and must never disappear.
+
+    Usage is the same as the wrapped metric: GUARDED.labels(a="x").inc()
+    """
+
+    def __init__(self, metric_cls, name: str, documentation: str,
+                 labelnames: List[str], max_series: Optional[int] = None,
+                 overflow_labels: Optional[List[str]] = None,
+                 series_ttl: Optional[float] = DEFAULT_SERIES_TTL,
+                 registry=REGISTRY):
+        self.metric = metric_cls(name, documentation, labelnames, registry=registry)
+        self.name = name
+        self.labelnames = list(labelnames)
+        self.max_series = max_series if max_series is not None else DEFAULT_MAX_SERIES
+        self.overflow_labels = list(overflow_labels or labelnames)
+        self.series_ttl = series_ttl
+        self.registry = registry
+
+        self._last_seen: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        METRIC_ACTIVE_SERIES.labels(metric=self.name).set(0)
+        _GUARDS.append(self)
+
+    def __getattr__(self, attr):
+        # Anything not overridden here (describe, collect, ...) goes to the metric
+        return getattr(self.metric, attr)
+
+    def _key(self, args, kwargs) -> Tuple[str, ...]:
+        """Validate labels the same way prometheus_client does, before any budget is used"""
+        if args and kwargs:
+            raise ValueError("Can't pass both *args and **kwargs")
+        if args:
+            if len(args) != len(self.labelnames):
+                raise ValueError("Incorrect label count")
+            return tuple(str(v) for v in args)
+        if sorted(kwargs) != sorted(self.labelnames):
+            raise ValueError("Incorrect label names")
+        return tuple(str(kwargs[label]) for label in self.labelnames)
+
+    def _overflow_key(self, key: Tuple[str, ...]) -> Tuple[str, ...]:
+        return tuple(
+            OVERFLOW_LABEL_VALUE if label in self.overflow_labels else value
+            for label, value in zip(self.labelnames, key)
+        )
+
+    def labels(self, *args, **kwargs):
+        """Return the child for these labels, or the overflow child if over budget"""
+        key = self._key(args, kwargs)
+        now = time.time()
+
+        with self._lock:
+            if key not in self._last_seen and len(self._last_seen) >= self.max_series:
+                METRIC_OVERFLOW_OBSERVATIONS.labels(metric=self.name).inc()
+                key = self._overflow_key(key)
+            self._last_seen[key] = now
+            METRIC_ACTIVE_SERIES.labels(metric=self.name).set(len(self._last_seen))
+
+        return self.metric.labels(*key)
+
+    def expire_stale(self, now: Optional[float] = None) -> int:
+        """Remove series idle for longer than series_ttl; returns how many were removed"""
+        if self.series_ttl is None:
+            return 0
+
+        now = now if now is not None else time.time()
+        with self._lock:
+            stale = [
+                key for key, last_seen in self._last_seen.items()
+                if now - last_seen > self.series_ttl
+            ]
+            for key in stale:
+                del self._last_seen[key]
+                try:
+                    self.metric.remove(*key)
+                except (KeyError, ValueError):
+                    pass
+            METRIC_ACTIVE_SERIES.labels(metric=self.name).set(len(self._last_seen))
+
+        return len(stale)
+
+    def active_series(self) -> int:
+        """Number of label sets currently exported"""
+        return len(self._last_seen)
+
+    def unregister(self):
+        """Drop the metric from its registry and stop tracking it (used by benchmarks/tests)"""
+        self.registry.unregister(self.metric)
+        for self_metric in (METRIC_ACTIVE_SERIES, METRIC_OVERFLOW_OBSERVATIONS):
+            try:
+                self_metric.remove(self.name)
+            except KeyError:
+                pass
+        if self in _GUARDS:
+            _GUARDS.remove(self)
+
+
+def expire_stale_series(now: Optional[float] = None) -> int:
+    """Run stale-series expiry on every guarded metric"""
+    return sum(guard.expire_stale(now) for guard in list(_GUARDS))
@@ -1,20 +1,55 @@
 # app/main.py
 from fastapi import FastAPI, Request, BackgroundTasks
-from fastapi.responses import Response
+from fastapi.responses import Response, JSONResponse
+import sys
 import time
 import asyncio
+import logging
 
 from metrics import (
     TOKENS_GENERATED, GPU_MEMORY_USAGE, GUARDRAIL_REJECTIONS,
     REQUEST_QUEUE_SIZE, MODEL_LOAD_STATUS, REQUEST_DURATION,
-    ACTIVE_REQUESTS, generate_latest
+    ACTIVE_REQUESTS, generate_latest, expire_stale_series
 )
 from model_client import ModelClient
 from guardrails import GuardrailSystem
+from startup import StartupPipeline
+from tracing import tracer, SpanExporter, TraceContextFilter
 
 app = FastAPI()
 model_client = ModelClient(model_name="mistral")
 guardrails = GuardrailSystem()
+startup_pipeline = StartupPipeline(model_client)
+span_exporter = SpanExporter(tracer)
+
+# Without an export sink nothing would drain the span store; keep only
+# trace context (IDs for logs and backend headers)
+tracer.record_spans = span_exporter.configured
+
+def setup_logging():
+    """JSON logs on stdout for this app; records carry trace_id/span_id"""
+    logger = logging.getLogger("metric_monitoring")
+    logger.addFilter(TraceContextFilter())
+    
+    # Already configured (e.g. uvicorn --log-config logging_config.json)
+    if logger.handlers:
+        return logger
+    
+    try:
+        from pythonjsonlogger.json import JsonFormatter
+    except ImportError:
+        from pythonjsonlogger.jsonlogger import JsonFormatter
+    
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter(
+        "%(message)s", rename_fields={"message": "msg"}, timestamp=True
+    ))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+logger = setup_logging()
 
 # Background task to update metrics
 async def update_metrics_background():
@@ -33,6 +68,9 @@ async def update_metrics_background():
         # Update GPU metrics
         model_client.update_gpu_metrics()
         
+        # Drop label sets that have gone idle
+        expire_stale_series()
+        
         await asyncio.sleep(5)  # Update every 5 seconds
 
 @app.on_event("startup")
@@ -41,64 +79,88 @@ async def startup():
     # Start background metrics updater
     asyncio.create_task(update_metrics_background())
     
-    # Load model and set status
-    try:
-        await model_client.load_model()
-        model_client.set_model_status(True)
-    except:
-        model_client.set_model_status(False)
-        raise
+    # Export kept trace spans in batches (file and/or local collector)
+    if span_exporter.configured:
+        asyncio.create_task(span_exporter.run())
+    
+    # GPU init, model load and warmup run in the background;
+    # /health/ready stays 503 until they finish
+    startup_pipeline.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush kept trace spans so a restart doesn't lose the last interval"""
+    if span_exporter.configured:
+        await span_exporter.flush()
 
 @app.post("/v1/generate")
 async def generate(request: Request):
     """Main generation endpoint with full metrics"""
     start_time = time.time()
+    trace = tracer.start_trace("POST /v1/generate")
+    status = "error"
     
-    # 1. Check guardrails
-    data = await request.json()
-    prompt = data.get("prompt", "")
-    
-    if not guardrails.check_input(prompt, model_client.model_name):
-        REQUEST_DURATION.labels(
-            model_name=model_client.model_name,
-            status="rejected"
-        ).set(time.time() - start_time)
-        return {"error": "Request rejected by guardrails"}
-    
-    # 2. Process request
     try:
-        # Add to queue
-        model_client.request_queue.append(request)
-        
-        # Generate response
-        response = await model_client.generate(prompt)
-        
-        # Record success duration
-        duration = time.time() - start_time
-        REQUEST_DURATION.labels(
-            model_name=model_client.model_name,
-            status="success"
-        ).set(duration)
-        
-        # Remove from queue
-        if request in model_client.request_queue:
-            model_client.request_queue.remove(request)
+        # 1. Check guardrails
+        with tracer.span("json_parse"):
+            data = await request.json()
+            prompt = data.get("prompt", "")
         
-        return response
+        with tracer.span("guardrail_check"):
+            allowed = guardrails.check_input(prompt, model_client.model_name)
         
-    except Exception as e:
-        # Record error duration
-        duration = time.time() - start_time
-        REQUEST_DURATION.labels(
-            model_name=model_client.model_name,
-            status="error"
-        ).set(duration)
+        if not allowed:
+            status = "rejected"
+            REQUEST_DURATION.labels(
+                model_name=model_client.model_name,
+                status="rejected"
+            ).set(time.time() - start_time)
+            return {"error": "Request rejected by guardrails"}
         
-        # Clean up queue
-        if request in model_client.request_queue:
-            model_client.request_queue.remove(request)
-        
-        return {"error": str(e)}
+        # 2. Process request
+        try:
+            # Add to queue
+            with tracer.span("queue_wait"):
+                model_client.request_queue.append(request)
+            
+            # Generate response (backend_call / nvml_update spans inside)
+            response = await model_client.generate(prompt)
+            
+            # Record success duration
+            status = "success"
+            duration = time.time() - start_time
+            REQUEST_DURATION.labels(
+                model_name=model_client.model_name,
+                status="success"
+            ).set(duration)
+            
+            # Remove from queue
+            if request in model_client.request_queue:
+                model_client.request_queue.remove(request)
+            
+            return response
+            
+        except Exception as e:
+            # Record error duration
+            duration = time.time() - start_time
+            REQUEST_DURATION.labels(
+                model_name=model_client.model_name,
+                status="error"
+            ).set(duration)
+            
+            # Clean up queue
+            if request in model_client.request_queue:
+                model_client.request_queue.remove(request)
+            
+            return {"error": str(e)}
+    
+    finally:
+        # Log inside the trace so the record carries trace_id/span_id
+        logger.info("generate finished", extra={
+            "status": status,
+            "duration_ms": round((time.time() - start_time) * 1000, 2)
+        })
+        tracer.end_trace(trace, error=(status == "error"))
 
 @app.get("/metrics")
 async def get_metrics():
@@ -117,10 +179,30 @@ async def get_metrics():
 @app.get("/health")
 async def health_check():
     """Health check for SAP AI Core"""
-    is_healthy = await model_client.is_ready()
-    model_client.set_model_status(is_healthy)
+    model_loaded = await model_client.is_ready()
+    model_client.set_model_status(model_loaded)
+    is_healthy = model_loaded and startup_pipeline.ready
     
     return {
         "status": "healthy" if is_healthy else "unhealthy",
-        "model_loaded": is_healthy
+        "model_loaded": model_loaded
     }
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe - 503 after a fatal startup failure so the platform restarts us"""
+    if startup_pipeline.phase == "failed":
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed", "error": startup_pipeline.error}
+        )
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe - model loaded and warmup finished"""
+    status = startup_pipeline.status()
+    return JSONResponse(
+        status_code=200 if status["ready"] else 503,
+        content={"status": "ready" if status["ready"] else "not_ready", **status}
+    )
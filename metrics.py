@@ -1,50 +1,116 @@
 # metrics.py
 from prometheus_client import Counter, Gauge, generate_latest
+from cardinality import (
+    CardinalityGuard, expire_stale_series,
+    METRIC_ACTIVE_SERIES, METRIC_OVERFLOW_OBSERVATIONS
+)
+
+# Every labeled metric below is created through CardinalityGuard so client-controlled
+# labels (model_name today, tenant labels later) cannot create unbounded series.
 
 # 1. TOKENS GENERATED (Input vs Output)
-TOKENS_GENERATED = Counter(
+TOKENS_GENERATED = CardinalityGuard(
+    Counter,
     'tokens_generated_total',
     'Total tokens processed',
-    ['token_type', 'model_name']  # token_type: 'input' or 'output'
+    ['token_type', 'model_name'],  # token_type: 'input' or 'output'
+    overflow_labels=['model_name']
 )
 
 # 2. GPU MEMORY USAGE (Optional - requires NVIDIA GPU)
-GPU_MEMORY_USAGE = Gauge(
+GPU_MEMORY_USAGE = CardinalityGuard(
+    Gauge,
     'gpu_memory_usage_bytes',
     'GPU memory usage in bytes',
-    ['gpu_index']
+    ['gpu_index'],
+    max_series=64
 )
 
 # 3. GUARDRAIL REJECTIONS
-GUARDRAIL_REJECTIONS = Counter(
+GUARDRAIL_REJECTIONS = CardinalityGuard(
+    Counter,
     'guardrail_rejections_total',
     'Total requests rejected by guardrails',
-    ['guardrail_type', 'model_name']
+    ['guardrail_type', 'model_name'],
+    overflow_labels=['model_name']
 )
 
 # 4. REQUEST QUEUE SIZE
-REQUEST_QUEUE_SIZE = Gauge(
+REQUEST_QUEUE_SIZE = CardinalityGuard(
+    Gauge,
     'request_queue_size',
     'Current number of requests waiting',
     ['model_name']
 )
 
 # 5. MODEL LOAD STATUS
-MODEL_LOAD_STATUS = Gauge(
+MODEL_LOAD_STATUS = CardinalityGuard(
+    Gauge,
     'model_load_status',
     'Model load status (1=loaded, 0=error)',
-    ['model_name']
+    ['model_name'],
+    series_ttl=None  # set once at startup, must not expire
 )
 
 # Additional useful metrics
-REQUEST_DURATION = Gauge(
+REQUEST_DURATION = CardinalityGuard(
+    Gauge,
     'request_duration_seconds',
     'Request processing time',
-    ['model_name', 'status']
+    ['model_name', 'status'],
+    overflow_labels=['model_name']
 )
 
-ACTIVE_REQUESTS = Gauge(
+ACTIVE_REQUESTS = CardinalityGuard(
+    Gauge,
     'active_requests',
     'Currently processing requests',
     ['model_name']
 )
+
+# Startup pipeline metrics
+STARTUP_PHASE_DURATION = CardinalityGuard(
+    Gauge,
+    'startup_phase_duration_seconds',
+    'Time spent in each startup phase',
+    ['phase'],  # phase: 'gpu_init', 'model_load', 'warmup', 'total'
+    series_ttl=None
+)
+
+APP_READY = CardinalityGuard(
+    Gauge,
+    'app_ready',
+    'Readiness status (1=ready for traffic, 0=starting or failed)',
+    ['model_name'],
+    series_ttl=None
+)
+
+WARMUP_PROMPT_FAILURES = Counter(
+    'warmup_prompt_failures_total',
+    'Warmup prompts that failed or timed out during startup'
+)
+
+# Tracing metrics
+TRACES_KEPT = CardinalityGuard(
+    Counter,
+    'traces_kept_total',
+    'Request traces kept for export',
+    ['reason'],  # reason: 'head', 'slow' or 'error'
+    series_ttl=None
+)
+
+TRACE_SPANS_EXPORTED = CardinalityGuard(
+    Counter,
+    'trace_spans_exported_total',
+    'Spans exported as OTLP/JSON',
+    ['sink'],  # sink: 'file' or 'endpoint'
+    series_ttl=None
+)
+
+TRACE_SPANS_DROPPED = CardinalityGuard(
+    Counter,
+    'trace_spans_dropped_total',
+    'Spans dropped because the span store was full or an export sink failed',
+    ['reason'],  # reason: 'store_full', 'file' or 'endpoint'
+    series_ttl=None
+)
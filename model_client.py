@@ -3,6 +3,7 @@ import time
 import asyncio
 from typing import Dict, Any
 from metrics import TOKENS_GENERATED, MODEL_LOAD_STATUS, GPU_MEMORY_USAGE
+from tracing import tracer, trace_headers, SPAN_KIND_CLIENT
 
 class ModelClient:
     def __init__(self, model_name="llama2"):
@@ -11,13 +12,12 @@ class ModelClient:
         self.active_requests = 0
         self.model_loaded = False
         
-        # Initialize GPU monitoring if available
+        # GPU monitoring is initialized lazily by the startup pipeline
         self.gpu_available = False
         self.pynvml = None
-        self._init_gpu_monitoring()
     
-    def _init_gpu_monitoring(self):
-        """Initialize GPU metrics if NVIDIA GPU is present"""
+    def init_gpu_monitoring(self):
+        """Initialize GPU metrics if NVIDIA GPU is present (blocking, run off the event loop)"""
         try:
             import pynvml
             pynvml.nvmlInit()
@@ -74,7 +74,8 @@ class ModelClient:
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 'http://localhost:11434/api/generate',
-                json={'model': self.model_name, 'prompt': prompt, 'stream': False}
+                json={'model': self.model_name, 'prompt': prompt, 'stream': False},
+                headers=trace_headers()  # propagate W3C traceparent to the backend
             ) as resp:
                 result = await resp.json()
                 return {
@@ -116,7 +117,9 @@ class ModelClient:
         
         try:
             # Your existing generation logic
-            response = await self._call_model(prompt)
+            with tracer.span("backend_call", kind=SPAN_KIND_CLIENT) as span:
+                span.set_attribute("model.name", self.model_name)
+                response = await self._call_model(prompt)
             
             # TRACK TOKENS
             if 'input_tokens' in response:
@@ -132,7 +135,8 @@ class ModelClient:
                 ).inc(response['output_tokens'])
             
             # UPDATE GPU METRICS
-            self.update_gpu_metrics()
+            with tracer.span("nvml_update"):
+                self.update_gpu_metrics()
             
             return response
             
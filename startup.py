@@ -0,0 +1,141 @@
+# startup.py
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional
+from metrics import STARTUP_PHASE_DURATION, APP_READY, WARMUP_PROMPT_FAILURES
+
+PROMPTS_HEADER = "Original_Prompt"
+
+
+def load_warmup_prompts(path: str, count: int) -> List[str]:
+    """Read up to `count` warmup prompts from a prompts file (one per line)"""
+    if count <= 0 or not os.path.exists(path):
+        return []
+
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    # The bundled `prompts` file starts with a column header
+    if lines and lines[0] == PROMPTS_HEADER:
+        lines = lines[1:]
+
+    return lines[:count]
+
+
+class StartupPipeline:
+    """
+    Brings the app from cold start to ready-for-traffic.
+
+    Phases:
+      1. gpu_init + model_load  - run concurrently
+      2. warmup                 - send real prompts through the backend
+    The app is ready once warmup has run. Warmup is best-effort: failed or timed-out prompts are logged
+    and counted but do not block readiness. A model-load failure marks the
+    pipeline "failed", which makes liveness fail so the platform restarts
+    the instance. Each phase duration is exported as a metric.
+    """
+
+    def __init__(self, model_client, prompts_file: Optional[str] = None,
+                 warmup_count: Optional[int] = None,
+                 warmup_timeout: Optional[float] = None):
+        self.model_client = model_client
+        self.prompts_file = prompts_file or os.getenv("WARMUP_PROMPTS_FILE", "prompts")
+        self.warmup_count = (
+            warmup_count if warmup_count is not None
+            else int(os.getenv("WARMUP_PROMPT_COUNT", "3"))
+        )
+        self.warmup_timeout = (
+            warmup_timeout if warmup_timeout is not None
+            else float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+        )
+
+        self.ready = False
+        self.phase = "pending"
+        self.error = None
+        self.warmup_failures = 0
+        self.phase_durations: Dict[str, float] = {}
+        self.task = None
+
+    def start(self):
+        """Run the pipeline in the background so liveness responds during warmup"""
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    async def _timed(self, phase: str, awaitable):
+        """Await a phase and record how long it took"""
+        start_time = time.time()
+        try:
+            return await awaitable
+        finally:
+            duration = time.time() - start_time
+            self.phase_durations[phase] = duration
+            STARTUP_PHASE_DURATION.labels(phase=phase).set(duration)
+
+    async def run(self):
+        """Initialize subsystems, warm up the backend and flip readiness"""
+        self.ready = False
+        self.error = None
+        self.warmup_failures = 0
+        APP_READY.labels(model_name=self.model_client.model_name).set(0)
+        start_time = time.time()
+
+        try:
+            # GPU init is blocking (pynvml), so keep it off the event loop
+            self.phase = "initializing"
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(
+                self._timed(
+                    "gpu_init",
+                    loop.run_in_executor(None, self.model_client.init_gpu_monitoring)
+                ),
+                self._timed("model_load", self.model_client.load_model()),
+            )
+            self.model_client.set_model_status(True)
+
+            self.phase = "warmup"
+            await self._timed("warmup", self.warmup())
+
+            self.phase = "ready"
+            self.ready = True
+        except Exception as e:
+            print(f"Startup failed during {self.phase}: {e!r}")
+            self.phase = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            self.model_client.set_model_status(False)
+        finally:
+            duration = time.time() - start_time
+            self.phase_durations["total"] = duration
+            STARTUP_PHASE_DURATION.labels(phase="total").set(duration)
+            APP_READY.labels(
+                model_name=self.model_client.model_name
+            ).set(1 if self.ready else 0)
+
+        return self.ready
+
+    async def warmup(self):
+        """Send warmup prompts straight to the backend (not counted as traffic)"""
+        prompts = load_warmup_prompts(self.prompts_file, self.warmup_count)
+        for prompt in prompts:
+            try:
+                await asyncio.wait_for(
+                    self.model_client._call_model(prompt),
+                    timeout=self.warmup_timeout
+                )
+            except Exception as e:
+                # A slow first request is what warmup is for - don't fail on it
+                self.warmup_failures += 1
+                WARMUP_PROMPT_FAILURES.inc()
+                print(f"Warmup prompt failed: {type(e).__name__}: {e}")
+        print(f"Warmup complete: {len(prompts)} prompts, {self.warmup_failures} failed")
+        return len(prompts) - self.warmup_failures
+
+    def status(self) -> Dict:
+        """Snapshot used by the readiness endpoint"""
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "warmup_failures": self.warmup_failures,
+            "phase_durations": self.phase_durations,
+        }
@@ -0,0 +1,370 @@
+# tracing.py
+import os
+import json
+import asyncio
+import time
+import random
+import logging
+import contextvars
+from collections import deque
+from typing import Any, Dict, List, Optional
+from metrics import TRACES_KEPT, TRACE_SPANS_DROPPED, TRACE_SPANS_EXPORTED
+
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "metric-monitoring")
+
+# OTLP span kinds / status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return "%0*x" % (nbytes * 2, random.getrandbits(nbytes * 8))
+
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str,
+                 kind: int = SPAN_KIND_INTERNAL):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = STATUS_OK
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict:
+        """OTLP/JSON representation of this span"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """All spans of one request, held until the tail-sampling decision"""
+
+    __slots__ = ("trace_id", "root", "spans", "head_sampled", "error")
+
+    def __init__(self, name: str, head_sampled: bool):
+        self.trace_id = _new_id(16)
+        self.root = Span(self.trace_id, None, name, kind=SPAN_KIND_SERVER)
+        self.spans: List[Span] = []
+        self.head_sampled = head_sampled
+        self.error = False
+
+
+class _SpanContext:
+    """Context manager returned by Tracer.span()"""
+
+    __slots__ = ("trace", "span", "token")
+
+    def __init__(self, trace: Trace, name: str, kind: int):
+        parent = _current_span.get()
+        self.trace = trace
+        self.span = Span(trace.trace_id, parent.span_id if parent else trace.root.span_id,
+                         name, kind)
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.span.status = STATUS_ERROR
+            self.span.set_attribute("exception.type", exc_type.__name__)
+            self.trace.error = True
+        self.trace.spans.append(self.span)
+        _current_span.reset(self.token)
+        return False
+
+
+class _NoopSpan:
+    """Shared no-op span used when tracing is disabled or outside a trace"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Lightweight per-request tracer.
+
+    Sampling:
+      - head: a trace is kept with probability `sample_rate`, decided at start
+      - tail: slow (>= slow_threshold_ms) or errored traces are always kept
+    Kept spans go into a bounded in-memory store and are drained in
+    batches by SpanExporter. When the store is full, new traces are
+    dropped whole.
+
+    With record_spans=False (no export sink configured) only the trace
+    context is kept: IDs still reach logs and backend headers, but stage
+    spans are no-ops and nothing is stored.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None,
+                 sample_rate: Optional[float] = None,
+                 slow_threshold_ms: Optional[float] = None,
+                 max_spans: Optional[int] = None,
+                 record_spans: bool = True):
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("TRACING_ENABLED", "true").lower() == "true"
+        )
+        self.record_spans = record_spans
+        self.sample_rate = (
+            sample_rate if sample_rate is not None
+            else float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+        )
+        self.slow_threshold_ms = (
+            slow_threshold_ms if slow_threshold_ms is not None
+            else float(os.getenv("TRACE_SLOW_THRESHOLD_MS", "1000"))
+        )
+        self.max_spans = (
+            max_spans if max_spans is not None
+            else int(os.getenv("TRACE_MAX_SPANS", "10000"))
+        )
+        self.spans = deque()
+
+    def start_trace(self, name: str) -> Optional[Trace]:
+        """Begin a request trace and make it current"""
+        if not self.enabled:
+            return None
+        trace = Trace(name, head_sampled=random.random() < self.sample_rate)
+        _current_trace.set(trace)
+        _current_span.set(trace.root)
+        return trace
+
+    def end_trace(self, trace: Optional[Trace], error: bool = False) -> bool:
+        """Finish a trace and apply tail sampling; returns True if kept"""
+        if trace is None:
+            return False
+
+        root = trace.root
+        root.end_ns = time.time_ns()
+        trace.error = trace.error or error
+        if trace.error:
+            root.status = STATUS_ERROR
+        _current_trace.set(None)
+        _current_span.set(None)
+
+        # Nothing drains the store, so don't fill it
+        if not self.record_spans:
+            return False
+
+        duration_ms = (root.end_ns - root.start_ns) / 1e6
+        if trace.error:
+            reason = "error"
+        elif duration_ms >= self.slow_threshold_ms:
+            reason = "slow"
+        elif trace.head_sampled:
+            reason = "head"
+        else:
+            return False
+
+        root.set_attribute("sampling.reason", reason)
+        finished = [root] + trace.spans
+
+        # Reject the whole trace rather than evicting old spans one by one,
+        # so exported batches never hold children whose root was dropped
+        if len(self.spans) + len(finished) > self.max_spans:
+            TRACE_SPANS_DROPPED.labels(reason="store_full").inc(len(finished))
+            return False
+
+        self.spans.extend(finished)
+        TRACES_KEPT.labels(reason=reason).inc()
+        return True
+
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL):
+        """Time a stage of the current trace: `with tracer.span("guardrail_check"):`"""
+        trace = _current_trace.get()
+        if trace is None or not self.record_spans:
+            return _NOOP_SPAN
+        return _SpanContext(trace, name, kind)
+
+    def drain(self, max_items: int) -> List[Span]:
+        """Remove and return up to max_items finished spans"""
+        batch = []
+        while self.spans and len(batch) < max_items:
+            batch.append(self.spans.popleft())
+        return batch
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp_json(spans: List[Span], service_name: str = SERVICE_NAME) -> Dict:
+    """Wrap spans in an OTLP/JSON ExportTraceServiceRequest body"""
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [_otlp_attribute("service.name", service_name)]
+            },
+            "scopeSpans": [{
+                "scope": {"name": service_name},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]
+    }
+
+
+class SpanExporter:
+    """
+    Drains the tracer store in batches and writes OTLP/JSON to a file
+    (one request body per line) and/or POSTs it to a collector
+    (e.g. http://localhost:4318/v1/traces).
+    """
+
+    def __init__(self, tracer: Tracer, file_path: Optional[str] = None,
+                 endpoint: Optional[str] = None, batch_size: Optional[int] = None,
+                 interval: Optional[float] = None, timeout: Optional[float] = None):
+        self.tracer = tracer
+        self.file_path = file_path or os.getenv("TRACE_EXPORT_FILE")
+        self.endpoint = endpoint or os.getenv("TRACE_EXPORT_ENDPOINT")
+        self.batch_size = batch_size or int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "512"))
+        self.interval = interval or float(os.getenv("TRACE_EXPORT_INTERVAL_SECONDS", "5"))
+        self.timeout = timeout or float(os.getenv("TRACE_EXPORT_TIMEOUT_SECONDS", "5"))
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.file_path or self.endpoint)
+
+    async def flush(self) -> int:
+        """Export everything currently in the store; returns spans delivered to at least one sink"""
+        exported = 0
+        session = None
+        try:
+            while True:
+                batch = self.tracer.drain(self.batch_size)
+                if not batch:
+                    return exported
+                body = to_otlp_json(batch)
+
+                # One collector session per flush, bounded so a stuck
+                # collector can't hold up the export loop or shutdown
+                if self.endpoint and session is None:
+                    import aiohttp
+                    session = aiohttp.ClientSession(
+                        timeout=aiohttp.ClientTimeout(total=self.timeout)
+                    )
+
+                # Each sink succeeds or fails on its own
+                delivered = False
+                for sink in self._sinks():
+                    try:
+                        if sink == "file":
+                            await self._export_file(body)
+                        else:
+                            await self._export_endpoint(session, body)
+                        TRACE_SPANS_EXPORTED.labels(sink=sink).inc(len(batch))
+                        delivered = True
+                    except Exception as e:
+                        print(f"Trace export to {sink} failed: {type(e).__name__}: {e}")
+                        TRACE_SPANS_DROPPED.labels(reason=sink).inc(len(batch))
+                if delivered:
+                    exported += len(batch)
+        finally:
+            if session is not None:
+                await session.close()
+
+    def _sinks(self) -> List[str]:
+        sinks = []
+        if self.file_path:
+            sinks.append("file")
+        if self.endpoint:
+            sinks.append("endpoint")
+        return sinks
+
+    def _write_file(self, line: str):
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def _export_file(self, body: Dict):
+        # Blocking file I/O stays off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_file, json.dumps(body) + "\n")
+
+    async def _export_endpoint(self, session, body: Dict):
+        async with session.post(self.endpoint, json=body) as resp:
+            resp.raise_for_status()
+
+    async def run(self):
+        """Background loop: flush every `interval` seconds"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+class TraceContextFilter(logging.Filter):
+    """Adds trace_id/span_id to log records so JSON logs can be joined to traces"""
+
+    def filter(self, record):
+        trace = _current_trace.get()
+        span = _current_span.get()
+        record.trace_id = trace.trace_id if trace else None
+        record.span_id = span.span_id if span else None
+        return True
+
+
+def trace_headers() -> Dict[str, str]:
+    """
+    W3C traceparent header for outgoing backend calls (empty outside a trace).
+
+    The sampled flag only carries the head decision: the tail decision
+    (error/slow) is made after the backend call returns, so traces kept by
+    tail sampling go out with flag 00. Backends should record on 00 as
+    well and leave the keep/drop decision to the collector, otherwise
+    their side of exactly the slow and errored requests is lost.
+    """
+    trace = _current_trace.get()
+    span = _current_span.get()
+    if trace is None or span is None:
+        return {}
+    flags = "01" if trace.head_sampled else "00"
+    return {"traceparent": f"00-{trace.trace_id}-{span.span_id}-{flags}"}
+
+
+# Process-wide tracer, configured from the environment
+tracer = Tracer()